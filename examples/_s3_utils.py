@@ -0,0 +1,178 @@
+"""
+Shared helpers for the example scripts
+"""
+import functools
+import hashlib
+import io
+import json
+import os
+import time
+import types
+
+from dotenv import dotenv_values
+
+# On-disk cache for STS caller identity, reused across script runs
+IDENTITY_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "mcp-s3", "identity.json")
+IDENTITY_CACHE_TTL = 15 * 60  # 15 minutes
+
+# In-process cache, keyed the same way as the on-disk cache
+_identity_cache = {}
+
+# Error codes (from STS or S3) meaning the credentials themselves were rejected
+REJECTED_CREDENTIAL_CODES = {
+    'InvalidAccessKeyId',
+    'InvalidClientTokenId',
+    'SignatureDoesNotMatch',
+    'ExpiredToken',
+}
+
+@functools.lru_cache(maxsize=1)
+def boto_config():
+    """Client config shared by every script: a 50-connection pool and standard retries"""
+    # Built lazily so scripts can handle --help without importing botocore
+    from botocore.config import Config
+    return Config(
+        max_pool_connections=50,
+        retries={'mode': 'standard', 'max_attempts': 5}
+    )
+
+@functools.lru_cache(maxsize=1)
+def _transfer_config():
+    """Managed transfers switch to parallel multipart uploads above 8MB"""
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=8 * 1024 * 1024, max_concurrency=10)
+
+@functools.lru_cache(maxsize=1)
+def _parse_env_file(path, mtime):
+    """Parse a .env file once per modification time"""
+    values = dotenv_values(path)
+    return types.MappingProxyType({key: value for key, value in values.items() if value is not None})
+
+def load_env(path='.env'):
+    """Load a .env file into os.environ (without overriding) and return its values read-only"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return types.MappingProxyType({})
+    values = _parse_env_file(path, mtime)
+    for key, value in values.items():
+        os.environ.setdefault(key, value)
+    return values
+
+def _identity_cache_key(access_key=None, secret_key=None):
+    """Build a cache key for the active credentials without storing them"""
+    if access_key:
+        digest = hashlib.sha256(f"{access_key}:{secret_key or ''}".encode('utf-8')).hexdigest()
+        return f"key:{digest[:16]}"
+    return f"profile:{os.getenv('AWS_PROFILE', 'default')}"
+
+def _load_identity_cache():
+    """Read the on-disk identity cache, ignoring missing or corrupt files"""
+    try:
+        with open(IDENTITY_CACHE_PATH, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def _save_identity_cache(cache):
+    """Write the on-disk identity cache (best effort, owner-readable only)"""
+    try:
+        os.makedirs(os.path.dirname(IDENTITY_CACHE_PATH), exist_ok=True)
+        tmp_path = f"{IDENTITY_CACHE_PATH}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, IDENTITY_CACHE_PATH)
+    except OSError:
+        pass
+
+def _is_fresh_entry(entry, now):
+    """Return True if a disk cache entry is well-formed and within the TTL"""
+    if not isinstance(entry, dict):
+        return False
+    cached_at = entry.get('cached_at')
+    if isinstance(cached_at, bool) or not isinstance(cached_at, (int, float)):
+        return False
+    identity = entry.get('identity')
+    if not isinstance(identity, dict):
+        return False
+    if not all(isinstance(identity.get(field), str) for field in ('Account', 'Arn', 'UserId')):
+        return False
+    return 0 <= now - cached_at < IDENTITY_CACHE_TTL
+
+def get_caller_identity(sts_client, access_key=None, secret_key=None, use_cache=True):
+    """Return (identity, from_cache) for the STS caller, cached in-process and on disk"""
+    # use_cache=False always asks STS, but the fresh result is still stored
+    cache_key = _identity_cache_key(access_key, secret_key)
+    if use_cache and cache_key in _identity_cache:
+        return _identity_cache[cache_key], True
+
+    now = time.time()
+    disk_cache = _load_identity_cache()
+    entry = disk_cache.get(cache_key)
+    from_cache = use_cache and _is_fresh_entry(entry, now)
+    if from_cache:
+        identity = entry['identity']
+    else:
+        response = sts_client.get_caller_identity()
+        identity = {
+            'Account': response['Account'],
+            'Arn': response['Arn'],
+            'UserId': response['UserId'],
+        }
+        # Drop expired or malformed entries while we're rewriting the file
+        disk_cache = {
+            key: value for key, value in disk_cache.items()
+            if _is_fresh_entry(value, now)
+        }
+        disk_cache[cache_key] = {'identity': identity, 'cached_at': now}
+        _save_identity_cache(disk_cache)
+
+    _identity_cache[cache_key] = identity
+    return identity, from_cache
+
+def forget_caller_identity(access_key=None, secret_key=None):
+    """Evict cached identity for credentials that AWS has since rejected"""
+    cache_key = _identity_cache_key(access_key, secret_key)
+    _identity_cache.pop(cache_key, None)
+    disk_cache = _load_identity_cache()
+    if disk_cache.pop(cache_key, None) is not None:
+        _save_identity_cache(disk_cache)
+
+def forget_if_rejected(error, access_key=None, secret_key=None):
+    """Evict the cached identity if error shows AWS rejected the credentials"""
+    response = getattr(error, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    if response.get('Error', {}).get('Code') not in REJECTED_CREDENTIAL_CODES:
+        return False
+    forget_caller_identity(access_key, secret_key)
+    return True
+
+def write_probe(s3_client, bucket_name, key, body):
+    """Upload a probe object through the managed transfer path to confirm write access"""
+    s3_client.upload_fileobj(io.BytesIO(body), bucket_name, key, Config=_transfer_config())
+
+def read_probe(s3_client, bucket_name, key, body):
+    """Check the probe object's metadata and return True if it matches body"""
+    # head_object needs the same s3:GetObject permission as a download but skips the body
+    response = s3_client.head_object(Bucket=bucket_name, Key=key)
+    if response['ContentLength'] != len(body):
+        return False
+    # Single-part ETags are the content MD5, except under SSE-KMS where only size is comparable
+    if response.get('ServerSideEncryption', '').startswith('aws:kms'):
+        return True
+    return response['ETag'].strip('"') == hashlib.md5(body, usedforsecurity=False).hexdigest()
+
+def presign_probe(s3_client, bucket_name, key, expires_in=3600):
+    """Generate a presigned GET URL for the probe object"""
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket_name, 'Key': key},
+        ExpiresIn=expires_in
+    )
+
+def delete_probe(s3_client, bucket_name, key):
+    """Remove the probe object"""
+    s3_client.delete_object(Bucket=bucket_name, Key=key)
@@ -2,74 +2,161 @@
 """
 Setup S3 bucket for MCP file upload server
 """
-import boto3
-import json
+import argparse
+import functools
+import random
+import time
 import uuid
-from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+# boto3/botocore are imported inside the functions that need them so that
+# `--help` returns without paying their import cost
+from _s3_utils import boto_config, delete_probe, forget_if_rejected, get_caller_identity, presign_probe, read_probe, write_probe
+
+@functools.lru_cache(maxsize=1)
+def _s3_config():
+    """S3 client config with adaptive retries for post-create propagation errors"""
+    from botocore.config import Config
+    # Adaptive mode adds client-side rate limiting on top of exponential backoff with jitter
+    return boto_config().merge(Config(retries={'mode': 'adaptive', 'max_attempts': 10}))
+
+# Bounded retries for bucket name collisions and post-create propagation
+MAX_BUCKET_NAME_ATTEMPTS = 5
+MAX_PROPAGATION_ATTEMPTS = 5
+
+# Errors that clear on their own once a new bucket has propagated or a
+# concurrent configuration change on it has finished
+RETRYABLE_ERROR_CODES = {'OperationAborted', 'NoSuchBucket', '404'}
+
+# Poll every 2s for up to 30s while a new bucket propagates
+BUCKET_WAITER_CONFIG = {'Delay': 2, 'MaxAttempts': 15}
+
+# Object written and read back by test_bucket_access
+_PROBE_KEY = "test-access.txt"
+_PROBE_BODY = b"MCP server access test"
+
+@functools.lru_cache(maxsize=1)
+def _get_session():
+    """Return a shared boto3 session so every client reuses the same config"""
+    import boto3
+    return boto3.session.Session()
+
+def _credential_keys(session):
+    """Return (access_key, secret_key) for the session, or (None, None) if unresolved"""
+    credentials = session.get_credentials()
+    if credentials:
+        return credentials.access_key, credentials.secret_key
+    return None, None
+
+def _retry_with_jitter(func, *args, attempts=MAX_PROPAGATION_ATTEMPTS, base_delay=0.5, max_delay=8.0, **kwargs):
+    """Call func, retrying propagation/conflict errors with full-jitter exponential backoff"""
+    from botocore.exceptions import ClientError
+    
+    # Throttling and 5xx are already retried by the client's adaptive mode;
+    # anything else (AccessDenied, MalformedXML, ...) will never succeed
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except ClientError as e:
+            if attempt == attempts - 1 or e.response['Error']['Code'] not in RETRYABLE_ERROR_CODES:
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
 
 def create_bucket_name():
     """Generate a unique bucket name"""
     random_suffix = str(uuid.uuid4())[:8]
     return f"mcp-uploads-{random_suffix}"
 
-def setup_s3_bucket():
+def setup_s3_bucket(s3_client=None, versioning=False):
     """Create and configure S3 bucket for MCP uploads"""
+    from botocore.exceptions import ClientError, WaiterError
     
-    # Initialize S3 client
-    s3_client = boto3.client('s3')
+    # Initialize S3 client (reused across retries)
+    if s3_client is None:
+        s3_client = _get_session().client('s3', config=_s3_config())
     
-    # Generate unique bucket name
-    bucket_name = create_bucket_name()
+    # Get current region (the same for every attempt)
+    region = s3_client.meta.region_name or 'us-east-1'
+    print(f"📍 Using region: {region}")
     
-    try:
-        print(f"🪣 Creating S3 bucket: {bucket_name}")
-        
-        # Get current region
-        region = s3_client.meta.region_name or 'us-east-1'
-        print(f"📍 Using region: {region}")
-        
-        # Create bucket
-        if region == 'us-east-1':
-            # us-east-1 doesn't need LocationConstraint
-            s3_client.create_bucket(Bucket=bucket_name)
-        else:
-            s3_client.create_bucket(
-                Bucket=bucket_name,
-                CreateBucketConfiguration={'LocationConstraint': region}
-            )
-        
-        print("✅ Bucket created successfully!")
-        
-        # Configure bucket settings
-        configure_bucket_settings(s3_client, bucket_name)
-        
-        # Test bucket access
-        test_bucket_access(s3_client, bucket_name)
-        
-        print(f"\n🎉 Setup complete!")
-        print(f"📋 Bucket name: {bucket_name}")
-        print(f"🔧 Use this command to start your MCP server:")
-        print(f"   python mcp_box.py --bucket {bucket_name} --root /path/to/your/upload/folder")
-        
-        return bucket_name
+    create_kwargs = {}
+    if region != 'us-east-1':
+        # us-east-1 doesn't need LocationConstraint
+        create_kwargs['CreateBucketConfiguration'] = {'LocationConstraint': region}
+    
+    # Only the bucket name changes between attempts; client and settings are reused
+    for attempt in range(MAX_BUCKET_NAME_ATTEMPTS):
+        # Generate unique bucket name
+        bucket_name = create_bucket_name()
         
-    except ClientError as e:
-        error_code = e.response['Error']['Code']
-        if error_code == 'BucketAlreadyExists':
-            print(f"❌ Bucket name {bucket_name} already exists globally. Trying another...")
-            return setup_s3_bucket()  # Retry with new name
-        else:
-            print(f"❌ Error creating bucket: {e}")
-            return None
+        try:
+            print(f"🪣 Creating S3 bucket: {bucket_name}")
+            
+            # Create bucket
+            s3_client.create_bucket(Bucket=bucket_name, **create_kwargs)
+            
+            print("✅ Bucket created successfully!")
+            
+            # Wait until the new bucket is visible before configuring it
+            try:
+                s3_client.get_waiter('bucket_exists').wait(
+                    Bucket=bucket_name,
+                    WaiterConfig=BUCKET_WAITER_CONFIG
+                )
+            except WaiterError as e:
+                print(f"⚠️ Warning: Bucket not visible yet, continuing anyway: {e}")
+            
+            # Configure bucket settings
+            configure_bucket_settings(s3_client, bucket_name, versioning)
+            
+            # Test bucket access
+            test_bucket_access(s3_client, bucket_name)
+            
+            print(f"\n🎉 Setup complete!")
+            print(f"📋 Bucket name: {bucket_name}")
+            print(f"🔧 Use this command to start your MCP server:")
+            print(f"   python mcp_box.py --bucket {bucket_name} --root /path/to/your/upload/folder")
+            
+            return bucket_name
+            
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code == 'BucketAlreadyExists':
+                print(f"❌ Bucket name {bucket_name} already exists globally. Trying another...")
+                continue  # Retry with new name
+            else:
+                forget_if_rejected(e, *_credential_keys(_get_session()))
+                print(f"❌ Error creating bucket: {e}")
+                return None
+    
+    print(f"❌ Could not find an available bucket name after {MAX_BUCKET_NAME_ATTEMPTS} attempts")
+    return None
 
-def configure_bucket_settings(s3_client, bucket_name):
+def configure_bucket_settings(s3_client, bucket_name, versioning=False):
     """Configure bucket with security and lifecycle settings"""
+    from botocore.exceptions import ClientError
     
     print("🔒 Configuring bucket security...")
     
-    try:
+    # Set up lifecycle policy to clean up old uploads
+    lifecycle_policy = {
+        'Rules': [
+            {
+                'ID': 'DeleteOldUploads',
+                'Status': 'Enabled',
+                'Filter': {'Prefix': ''},
+                'Expiration': {'Days': 30},  # Delete files after 30 days
+                'NoncurrentVersionExpiration': {'NoncurrentDays': 7}
+            }
+        ]
+    }
+    
+    # The settings are independent, so apply them concurrently and report in order.
+    # Each entry is (name for warnings, success message, call).
+    settings = [
         # Block public access (security best practice)
-        s3_client.put_public_access_block(
+        ("public access block", "Public access blocked", functools.partial(
+            s3_client.put_public_access_block,
             Bucket=bucket_name,
             PublicAccessBlockConfiguration={
                 'BlockPublicAcls': True,
@@ -77,37 +164,15 @@ def configure_bucket_settings(s3_client, bucket_name):
                 'BlockPublicPolicy': True,
                 'RestrictPublicBuckets': True
             }
-        )
-        print("  ✅ Public access blocked")
-        
-        # Enable versioning (optional but recommended)
-        s3_client.put_bucket_versioning(
-            Bucket=bucket_name,
-            VersioningConfiguration={'Status': 'Enabled'}
-        )
-        print("  ✅ Versioning enabled")
-        
-        # Set up lifecycle policy to clean up old uploads
-        lifecycle_policy = {
-            'Rules': [
-                {
-                    'ID': 'DeleteOldUploads',
-                    'Status': 'Enabled',
-                    'Filter': {'Prefix': ''},
-                    'Expiration': {'Days': 30},  # Delete files after 30 days
-                    'NoncurrentVersionExpiration': {'NoncurrentDays': 7}
-                }
-            ]
-        }
-        
-        s3_client.put_bucket_lifecycle_configuration(
+        )),
+        ("lifecycle policy", "Lifecycle policy set (30-day retention)", functools.partial(
+            s3_client.put_bucket_lifecycle_configuration,
             Bucket=bucket_name,
             LifecycleConfiguration=lifecycle_policy
-        )
-        print("  ✅ Lifecycle policy set (30-day retention)")
-        
+        )),
         # Enable server-side encryption
-        s3_client.put_bucket_encryption(
+        ("server-side encryption", "Server-side encryption enabled", functools.partial(
+            s3_client.put_bucket_encryption,
             Bucket=bucket_name,
             ServerSideEncryptionConfiguration={
                 'Rules': [
@@ -118,11 +183,32 @@ def configure_bucket_settings(s3_client, bucket_name):
                     }
                 ]
             }
-        )
-        print("  ✅ Server-side encryption enabled")
-        
-    except ClientError as e:
-        print(f"  ⚠️ Warning: Could not configure some settings: {e}")
+        )),
+    ]
+    
+    # Versioning is opt-in: uploads are temporary and the lifecycle policy
+    # already expires them, so extra versions only add storage cost
+    if versioning:
+        settings.append(("versioning", "Versioning enabled", functools.partial(
+            s3_client.put_bucket_versioning,
+            Bucket=bucket_name,
+            VersioningConfiguration={'Status': 'Enabled'}
+        )))
+    
+    # boto3 clients are thread-safe, so the workers share s3_client and its pool.
+    # Concurrent bucket config calls can be rejected with OperationAborted, which
+    # the jittered retry helper retries.
+    with ThreadPoolExecutor(max_workers=len(settings)) as executor:
+        futures = [
+            (name, done_message, executor.submit(_retry_with_jitter, apply))
+            for name, done_message, apply in settings
+        ]
+        for name, done_message, future in futures:
+            try:
+                future.result()
+                print(f"  ✅ {done_message}")
+            except ClientError as e:
+                print(f"  ⚠️ Warning: Could not apply {name}: {e}")
 
 def test_bucket_access(s3_client, bucket_name):
     """Test bucket read/write access"""
@@ -131,51 +217,46 @@ def test_bucket_access(s3_client, bucket_name):
     
     try:
         # Test write access
-        test_key = "test-access.txt"
-        test_content = "MCP server access test"
-        
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=test_key,
-            Body=test_content.encode('utf-8')
-        )
+        _retry_with_jitter(write_probe, s3_client, bucket_name, _PROBE_KEY, _PROBE_BODY)
         print("  ✅ Write access confirmed")
         
         # Test read access
-        response = s3_client.get_object(Bucket=bucket_name, Key=test_key)
-        content = response['Body'].read().decode('utf-8')
-        assert content == test_content
+        if not read_probe(s3_client, bucket_name, _PROBE_KEY, _PROBE_BODY):
+            raise RuntimeError("Probe object size or checksum doesn't match what was written")
         print("  ✅ Read access confirmed")
         
         # Test presigned URL generation
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': bucket_name, 'Key': test_key},
-            ExpiresIn=3600
-        )
+        presign_probe(s3_client, bucket_name, _PROBE_KEY)
         print("  ✅ Presigned URL generation confirmed")
         
         # Clean up test object
-        s3_client.delete_object(Bucket=bucket_name, Key=test_key)
+        delete_probe(s3_client, bucket_name, _PROBE_KEY)
         print("  ✅ Test cleanup completed")
         
     except Exception as e:
+        forget_if_rejected(e, *_credential_keys(_get_session()))
         print(f"  ❌ Access test failed: {e}")
 
-def check_aws_credentials():
+def check_aws_credentials(session=None):
     """Verify AWS credentials are configured"""
     
     print("🔐 Checking AWS credentials...")
     
+    if session is None:
+        session = _get_session()
+    
     try:
-        sts_client = boto3.client('sts')
-        identity = sts_client.get_caller_identity()
+        sts_client = session.client('sts', config=boto_config())
+        identity, from_cache = get_caller_identity(sts_client, *_credential_keys(session))
         
         print(f"  ✅ AWS Account ID: {identity['Account']}")
         print(f"  ✅ User/Role ARN: {identity['Arn']}")
+        if from_cache:
+            print("  ℹ️ Identity reused from cache (up to 15 minutes old)")
         return True
         
     except Exception as e:
+        forget_if_rejected(e, *_credential_keys(session))
         print(f"  ❌ AWS credentials not configured: {e}")
         print("\n🛠️ Please configure AWS credentials first:")
         print("   Option 1: aws configure")
@@ -183,12 +264,23 @@ def check_aws_credentials():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and configure an S3 bucket for the MCP upload server")
+    parser.add_argument(
+        "--versioning",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Enable object versioning on the new bucket (default: off)"
+    )
+    args = parser.parse_args()
+    
     print("🚀 Setting up S3 bucket for MCP file upload server...\n")
     
-    if not check_aws_credentials():
+    session = _get_session()
+    
+    if not check_aws_credentials(session):
         exit(1)
     
-    bucket_name = setup_s3_bucket()
+    bucket_name = setup_s3_bucket(session.client('s3', config=_s3_config()), versioning=args.versioning)
     
     if bucket_name:
         print(f"\n📝 Save this bucket name: {bucket_name}")
@@ -2,12 +2,94 @@
 """
 Test AWS S3 connection using credentials from .env file
 """
+import asyncio
+import functools
 import os
 import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
 from dotenv import load_dotenv
 
-def test_aws_credentials():
+from _s3_utils import boto_config, delete_probe, forget_if_rejected, get_caller_identity, presign_probe, read_probe, write_probe
+
+# Object written and read back by the permission checks
+_PROBE_KEY = "test-connection.txt"
+_PROBE_BODY = b"MCP server connection test"
+
+@functools.lru_cache(maxsize=None)
+def _get_client(service, access_key, secret_key, region):
+    """Return a cached boto3 client so its connection pool is reused"""
+    return boto3.client(
+        service,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name=region,
+        config=boto_config()
+    )
+
+def _report_identity(identity):
+    """Print the STS caller identity"""
+    print(f"   ✅ Credentials valid!")
+    print(f"   🆔 Account ID: {identity['Account']}")
+    print(f"   👤 User ARN: {identity['Arn']}")
+
+def _report_bucket_access(bucket_name, head_result):
+    """Report the head_bucket outcome; return True if the bucket is accessible"""
+    try:
+        if isinstance(head_result, Exception):
+            raise head_result
+        print(f"   ✅ Bucket '{bucket_name}' exists and is accessible!")
+        return True
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        if error_code == '404':
+            print(f"   ❌ Bucket '{bucket_name}' does not exist!")
+        elif error_code == '403':
+            print(f"   ❌ Access denied to bucket '{bucket_name}'!")
+            print("   💡 Check your IAM user permissions")
+        else:
+            print(f"   ❌ Error accessing bucket: {e}")
+        return False
+
+def _check_upload(s3_client, bucket_name):
+    """Upload the probe object; return True on success"""
+    try:
+        write_probe(s3_client, bucket_name, _PROBE_KEY, _PROBE_BODY)
+        print("   ✅ Upload permission confirmed!")
+        return True
+    except ClientError as e:
+        print(f"   ❌ Upload failed: {e}")
+        return False
+
+def _check_download(s3_client, bucket_name):
+    """Read the probe object back; return True if it matches"""
+    try:
+        if read_probe(s3_client, bucket_name, _PROBE_KEY, _PROBE_BODY):
+            print("   ✅ Download permission confirmed!")
+            return True
+        print("   ❌ Uploaded object size or checksum doesn't match!")
+        return False
+    except ClientError as e:
+        print(f"   ❌ Download failed: {e}")
+        return False
+
+def _report_presign(presign_result):
+    """Report the presigned URL outcome; return True on success"""
+    if isinstance(presign_result, Exception):
+        print(f"   ❌ Presigned URL generation failed: {presign_result}")
+        return False
+    print("   ✅ Presigned URL generated successfully!")
+    print(f"   🔗 URL: {presign_result[:60]}...")
+    return True
+
+def _cleanup(s3_client, bucket_name):
+    """Delete the probe object, warning on failure"""
+    try:
+        delete_probe(s3_client, bucket_name, _PROBE_KEY)
+        print("   ✅ Test file deleted!")
+    except ClientError as e:
+        print(f"   ⚠️ Warning: Could not delete test file: {e}")
+
+async def test_aws_credentials():
     """Test AWS credentials and S3 access"""
     
     print("🔐 Testing AWS credentials from .env file...\n")
@@ -42,102 +124,54 @@ def test_aws_credentials():
         return False
     
     try:
-        # Test STS (Security Token Service) - validates credentials
-        print("1️⃣ Testing AWS credentials...")
-        sts_client = boto3.client(
-            'sts',
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            region_name=region
+        sts_client = _get_client('sts', access_key, secret_key, region)
+        s3_client = _get_client('s3', access_key, secret_key, region)
+        
+        # The credential check, bucket check and presigning (client-side only)
+        # don't depend on each other, so overlap them
+        identity_result, head_result, presign_result = await asyncio.gather(
+            # Always ask STS here: validating the credentials is this script's job
+            asyncio.to_thread(get_caller_identity, sts_client, access_key, secret_key, use_cache=False),
+            asyncio.to_thread(s3_client.head_bucket, Bucket=bucket_name),
+            asyncio.to_thread(presign_probe, s3_client, bucket_name, _PROBE_KEY),
+            return_exceptions=True
         )
         
-        identity = sts_client.get_caller_identity()
-        print(f"   ✅ Credentials valid!")
-        print(f"   🆔 Account ID: {identity['Account']}")
-        print(f"   👤 User ARN: {identity['Arn']}")
+        # Test STS (Security Token Service) - validates credentials
+        print("1️⃣ Testing AWS credentials...")
+        if isinstance(identity_result, Exception):
+            raise identity_result
+        identity, _ = identity_result
+        _report_identity(identity)
         
         # Test S3 client creation
         print("\n2️⃣ Testing S3 client...")
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            region_name=region
-        )
         print(f"   ✅ S3 client created successfully!")
         print(f"   🌍 Region: {region}")
         
         # Test bucket access
         print(f"\n3️⃣ Testing access to bucket '{bucket_name}'...")
-        
-        # Check if bucket exists and is accessible
-        try:
-            s3_client.head_bucket(Bucket=bucket_name)
-            print(f"   ✅ Bucket '{bucket_name}' exists and is accessible!")
-        except ClientError as e:
-            error_code = e.response['Error']['Code']
-            if error_code == '404':
-                print(f"   ❌ Bucket '{bucket_name}' does not exist!")
-                return False
-            elif error_code == '403':
-                print(f"   ❌ Access denied to bucket '{bucket_name}'!")
-                print("   💡 Check your IAM user permissions")
-                return False
-            else:
-                print(f"   ❌ Error accessing bucket: {e}")
-                return False
+        if not _report_bucket_access(bucket_name, head_result):
+            return False
         
         # Test upload permission
         print("\n4️⃣ Testing upload permission...")
-        test_key = "test-connection.txt"
-        test_content = "MCP server connection test"
-        
-        try:
-            s3_client.put_object(
-                Bucket=bucket_name,
-                Key=test_key,
-                Body=test_content.encode('utf-8')
-            )
-            print("   ✅ Upload permission confirmed!")
-        except ClientError as e:
-            print(f"   ❌ Upload failed: {e}")
+        if not await asyncio.to_thread(_check_upload, s3_client, bucket_name):
             return False
         
         # Test download permission
         print("\n5️⃣ Testing download permission...")
-        try:
-            response = s3_client.get_object(Bucket=bucket_name, Key=test_key)
-            content = response['Body'].read().decode('utf-8')
-            if content == test_content:
-                print("   ✅ Download permission confirmed!")
-            else:
-                print("   ❌ Downloaded content doesn't match!")
-                return False
-        except ClientError as e:
-            print(f"   ❌ Download failed: {e}")
+        if not await asyncio.to_thread(_check_download, s3_client, bucket_name):
             return False
         
         # Test presigned URL generation
         print("\n6️⃣ Testing presigned URL generation...")
-        try:
-            presigned_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': bucket_name, 'Key': test_key},
-                ExpiresIn=3600
-            )
-            print("   ✅ Presigned URL generated successfully!")
-            print(f"   🔗 URL: {presigned_url[:60]}...")
-        except Exception as e:
-            print(f"   ❌ Presigned URL generation failed: {e}")
+        if not _report_presign(presign_result):
             return False
         
         # Clean up test file
         print("\n7️⃣ Cleaning up test file...")
-        try:
-            s3_client.delete_object(Bucket=bucket_name, Key=test_key)
-            print("   ✅ Test file deleted!")
-        except ClientError as e:
-            print(f"   ⚠️ Warning: Could not delete test file: {e}")
+        await asyncio.to_thread(_cleanup, s3_client, bucket_name)
         
         print(f"\n🎉 All tests passed! Your AWS setup is working correctly.")
         print(f"🚀 You can now run your MCP server with:")
@@ -150,10 +184,13 @@ def test_aws_credentials():
         return False
     except ClientError as e:
         error_code = e.response['Error']['Code']
-        if error_code == 'InvalidAccessKeyId':
+        forget_if_rejected(e, access_key, secret_key)
+        if error_code in ('InvalidAccessKeyId', 'InvalidClientTokenId'):
             print("❌ Invalid AWS Access Key ID!")
         elif error_code == 'SignatureDoesNotMatch':
             print("❌ Invalid AWS Secret Access Key!")
+        elif error_code == 'ExpiredToken':
+            print("❌ AWS session credentials have expired!")
         else:
             print(f"❌ AWS Error: {e}")
         return False
@@ -165,7 +202,7 @@ if __name__ == "__main__":
     print("🧪 AWS S3 Connection Test\n")
     print("📋 This script will test your AWS credentials from .env file\n")
     
-    if test_aws_credentials():
+    if asyncio.run(test_aws_credentials()):
         print("\n✅ Setup is ready for MCP server!")
     else:
         print("\n❌ Please fix the issues above before running the MCP server.")
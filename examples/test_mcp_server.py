@@ -3,16 +3,17 @@
 Test script for the MCP S3 upload server
 """
 import asyncio
-import tempfile
 import os
+import traceback
 from fastmcp import Client
-from dotenv import load_dotenv
+
+from _s3_utils import load_env
 
 async def test_server():
     """Test the MCP server functionality"""
     
-    # Load environment variables
-    load_dotenv()
+    # Load environment variables (parsed once and reused for the server subprocess)
+    env_vars = load_env('.env')
     bucket_name = os.getenv('S3_BUCKET_NAME')
     
     if not bucket_name:
@@ -24,10 +25,10 @@ async def test_server():
     os.makedirs(upload_dir, exist_ok=True)
     
     # Create a test file in the upload directory
-    test_content = "Hello, this is a test file for MCP S3 upload!\n" * 100
+    test_content = b"Hello, this is a test file for MCP S3 upload!\n" * 100
     test_file_path = os.path.join(upload_dir, "test-upload.txt")
     
-    with open(test_file_path, 'w') as f:
+    with open(test_file_path, 'wb') as f:
         f.write(test_content)
     
     print(f"📝 Created test file: {test_file_path}")
@@ -38,15 +39,12 @@ async def test_server():
         
         # Connect to the server script - FastMCP will handle launching it
         from fastmcp.client.transports import StdioTransport
-        from dotenv import dotenv_values
         
         # Pass environment variables to the server subprocess
-        env_vars = dotenv_values('.env')
-        
         transport = StdioTransport(
             command="python",
             args=["mcp_s3.py", "--root", upload_dir],
-            env=env_vars
+            env=dict(env_vars)
         )
         client = Client(transport)
         
@@ -75,7 +73,6 @@ async def test_server():
             
     except Exception as e:
         print(f"❌ Test failed: {e}")
-        import traceback
         traceback.print_exc()
     
     finally:
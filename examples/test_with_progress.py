@@ -3,27 +3,48 @@
 Test MCP server with progress tracking
 """
 import asyncio
-import tempfile
 import os
+import traceback
 from fastmcp import Client
-from dotenv import load_dotenv
+
+from _s3_utils import load_env
+
+# Lines per write when generating the test file
+BLOCK_LINES = 1024
+
+# Every possible progress bar, built once instead of on each update
+BAR_LENGTH = 40
+_BARS = tuple('█' * filled + '░' * (BAR_LENGTH - filled) for filled in range(BAR_LENGTH + 1))
+
+# Last percentage drawn, used to skip redraws smaller than 1%
+_last_percentage = None
+
+def _write_all(fd, data):
+    """Write all of data to fd, retrying on short writes"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
 
 async def progress_handler(progress: float, total: float | None, message: str | None):
     """Handle progress updates from the server"""
+    global _last_percentage
     if total is not None:
         percentage = (progress / total) * 100
-        bar_length = 40
-        filled_length = int(bar_length * progress / total)
-        bar = '█' * filled_length + '░' * (bar_length - filled_length)
-        print(f"\r📊 Progress: [{bar}] {percentage:.1f}% {message or ''}", end='', flush=True)
+        if (_last_percentage is not None and percentage < 100
+                and 0 <= percentage - _last_percentage < 1.0):
+            return
+        _last_percentage = percentage
+        filled_length = min(max(int(BAR_LENGTH * progress / total), 0), BAR_LENGTH)
+        print(f"\r📊 Progress: [{_BARS[filled_length]}] {percentage:.1f}% {message or ''}", end='', flush=True)
     else:
         print(f"\r📊 Progress: {progress} {message or ''}", end='', flush=True)
 
 async def test_with_progress():
     """Test server with progress tracking"""
     
-    # Load environment variables
-    load_dotenv()
+    # Load environment variables (parsed once and reused for the server subprocess)
+    env_vars = load_env('.env')
     bucket_name = os.getenv('S3_BUCKET_NAME')
     
     if not bucket_name:
@@ -36,11 +57,22 @@ async def test_with_progress():
     
     # Create a larger test file to see progress
     print("📝 Creating test file...")
-    test_content = "This is test data for progress tracking.\n" * 50000  # ~1.7MB
+    test_line = b"This is test data for progress tracking.\n"
+    line_count = 50000  # ~2MB
     test_file_path = os.path.join(upload_dir, "large-test.txt")
     
-    with open(test_file_path, 'w') as f:
-        f.write(test_content)
+    # Write fixed-size binary blocks straight to the fd so memory stays flat
+    # and no Python-level buffering or encoding is involved
+    block = test_line * BLOCK_LINES
+    # O_BINARY (Windows only) stops the CRT from translating \n to \r\n
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+    fd = os.open(test_file_path, flags, 0o644)
+    try:
+        for _ in range(line_count // BLOCK_LINES):
+            _write_all(fd, block)
+        _write_all(fd, test_line * (line_count % BLOCK_LINES))
+    finally:
+        os.close(fd)
     
     file_size = os.path.getsize(test_file_path)
     print(f"📏 Created test file: {file_size:,} bytes")
@@ -48,15 +80,12 @@ async def test_with_progress():
     try:
         # Connect with progress handler
         from fastmcp.client.transports import StdioTransport
-        from dotenv import dotenv_values
         
         # Pass environment variables to the server subprocess
-        env_vars = dotenv_values('.env')
-        
         transport = StdioTransport(
             command="python",
             args=["mcp_s3.py", "--root", upload_dir],
-            env=env_vars
+            env=dict(env_vars)
         )
         client = Client(transport, progress_handler=progress_handler)
         
@@ -75,7 +104,6 @@ async def test_with_progress():
             
     except Exception as e:
         print(f"\n❌ Test failed: {e}")
-        import traceback
         traceback.print_exc()
     
     finally: